@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+
+import reportes_aulas as ra
+
+
+FILAS = [
+    # NRC, ASIGNATURA, ID DOCENTE, DOCENTE, CORREO, PROGRAMA, OBSERVACION, CAL 1, CAL 2, FINAL
+    ("65-1001", "Cálculo I", 101, "ANA PÉREZ", "ana.perez@uniminuto.edu", "ADMI_SUR", "REV: SELECCIONADA", 45.0, 48.0, 93.0),
+    ("65-1002", "Cálculo II", 101, "ANA PÉREZ", "ana.perez@uniminuto.edu", "ADMI_SUR", "", 40.0, 42.0, 82.0),
+    ("65-1003", "Contabilidad", 102, "LUIS GÓMEZ", "luis.gomez@uniminuto.edu", "ADMI_SUR", "NO SELECCIONADA", 35.0, 36.5, 71.5),
+    ("65-2001", "Psicología general", 103, "MARTA RUIZ", "marta.ruiz@uniminuto.edu", "PSIC_CENTRO", "", 30.0, 30.0, 60.0),
+    ("65-2002", "Ética", 102, "LUIS GÓMEZ", "luis.gomez@uniminuto.edu", "PSIC_CENTRO", "", 46.0, 49.0, 95.0),
+    ("65-3001", "Inglés I", 104, "JUAN DÍAZ", "correo-invalido", "LENG_SUR", "", 42.0, 43.0, 85.0),
+]
+
+
+COLUMNAS = ["NRC", "ASIGNATURA", "MOMENTO", "ID DOCENTE", "DOCENTE", "CORREO", "Resp", "PROGRAMA",
+            "OBSERVACION", "CALIFICACION", "CALIFICACION 2", "CALIFICACION FINAL"]
+
+
+def crudo(filas=FILAS):
+    """DataFrame con las columnas del Excel de la campaña (DOCENTE en la columna E), sin normalizar."""
+    return pd.DataFrame([(nrc, asig, "MD2", idd, nom, correo, prog, prog, obs, c1, c2, fin)
+                         for nrc, asig, idd, nom, correo, prog, obs, c1, c2, fin in filas], columns=COLUMNAS)
+
+
+def frame(filas=FILAS):
+    """Como crudo(), ya normalizado y sin duplicados (lo que devuelve load_dataframe)."""
+    return ra.normalize_dataframe(crudo(filas))
+
+
+@pytest.fixture
+def df():
+    return frame()
+
+
+@pytest.fixture
+def coords():
+    return {"ADMI_SUR": {"corto": "ADMI", "coord": "Coordinación ADMI", "email": "coord.admi@uniminuto.edu"},
+            "PSIC_CENTRO": {"corto": "PSIC", "coord": "Coordinación PSIC", "email": "coord.psic@uniminuto.edu"}}
@@ -0,0 +1,170 @@
+"""Graph simulado en local: la parte de Microsoft Graph que usa GraphTransport."""
+import base64
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from reportes_aulas import GRAPH_LOTE
+
+
+class GraphMock:
+    """
+    Servidor HTTP local que imita la parte de Graph que usa GraphTransport: token (client
+    credentials), $batch de sendMail, borradores, adjuntos, sesiones de carga y /send.
+    Guarda lo recibido en `enviados` y con limitar=k responde 429 (Retry-After) a cada
+    k-ésima operación, dentro o fuera de un lote. Sirve para probar sin tenant real:
+
+        with GraphMock(limitar=7) as mock:
+            t = GraphTransport("informes@dominio.edu", mock.TOKEN, mock.url)
+    """
+
+    TOKEN = "token-de-prueba"
+
+    def __init__(self, host="127.0.0.1", port=0, limitar=0, retry_after=0):
+        self.host, self.port, self.limitar, self.retry_after = host, port, limitar, retry_after
+        self.lock = threading.Lock()
+        self.enviados = []        # [{"de", "asunto", "para", "adjuntos": [(nombre, bytes)], "via"}]
+        self.borradores = {}
+        self.sesiones = {}
+        self.operaciones = 0
+        self.limitadas = 0
+        self.lotes = []           # tamaño de cada $batch recibido
+        self.httpd = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1.0"
+
+    @property
+    def login_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _responder(self, status, datos=None, cabeceras=None):
+                raw = json.dumps(datos).encode("utf-8") if datos is not None else b""
+                self.send_response(status)
+                for k, v in (cabeceras or {}).items():
+                    self.send_header(k, v)
+                if datos is not None:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _cuerpo(self):
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def do_POST(self):
+                cuerpo = self._cuerpo()
+                if self.path.endswith("/oauth2/v2.0/token"):
+                    return self._responder(200, {"access_token": mock.TOKEN, "token_type": "Bearer", "expires_in": 3600})
+                if self.headers.get("Authorization") != f"Bearer {mock.TOKEN}":
+                    return self._responder(401, {"error": {"code": "InvalidAuthenticationToken", "message": "token"}})
+                datos = json.loads(cuerpo) if cuerpo else {}
+                self._responder(*mock._post(self.path, datos))
+
+            def do_PUT(self):
+                self._responder(*mock._put(self.path, self.headers.get("Content-Range", ""), self._cuerpo()))
+
+            def log_message(self, fmt, *a):
+                pass
+
+        class Servidor(ThreadingHTTPServer):
+            request_queue_size = 64
+            daemon_threads = True
+
+        self.httpd = Servidor((self.host, self.port), Handler)
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _limitada(self):
+        with self.lock:
+            self.operaciones += 1
+            if self.limitar and self.operaciones % self.limitar == 0:
+                self.limitadas += 1
+                return True
+        return False
+
+    def _limite(self):
+        return 429, {"error": {"code": "TooManyRequests", "message": "limitado"}}, {"Retry-After": str(self.retry_after)}
+
+    def _registrar(self, usuario, mensaje, adjuntos, via):
+        with self.lock:
+            self.enviados.append({
+                "de": unquote(usuario), "asunto": mensaje.get("subject"), "via": via,
+                "para": [r["emailAddress"]["address"] for r in mensaje.get("toRecipients", [])],
+                "adjuntos": adjuntos + [(a["name"], len(base64.b64decode(a["contentBytes"])))
+                                        for a in mensaje.get("attachments", [])],
+            })
+
+    def _post(self, ruta, datos):
+        partes = ruta.split("?")[0].strip("/").split("/")[1:]      # sin "v1.0"
+        if partes == ["$batch"]:
+            pedidos = datos.get("requests", [])
+            if len(pedidos) > GRAPH_LOTE:
+                return 400, {"error": {"code": "BadRequest", "message": f"más de {GRAPH_LOTE} solicitudes"}}, None
+            self.lotes.append(len(pedidos))
+            respuestas = []
+            for p in pedidos:
+                if self._limitada():
+                    status, cuerpo, cab = self._limite()
+                    respuestas.append({"id": p["id"], "status": status, "headers": cab, "body": cuerpo})
+                    continue
+                sub = p["url"].strip("/").split("/")
+                if len(sub) == 3 and sub[0] == "users" and sub[2] == "sendMail":
+                    self._registrar(sub[1], p["body"]["message"], [], "batch")
+                    respuestas.append({"id": p["id"], "status": 202, "headers": {}, "body": None})
+                else:
+                    respuestas.append({"id": p["id"], "status": 404, "headers": {},
+                                       "body": {"error": {"code": "NotFound", "message": p["url"]}}})
+            return 200, {"responses": respuestas}, None
+        if self._limitada():
+            return self._limite()
+        if len(partes) == 3 and partes[0] == "users" and partes[2] == "messages":
+            with self.lock:
+                mid = f"m{len(self.borradores) + 1}"
+                self.borradores[mid] = {"usuario": partes[1], "mensaje": datos, "adjuntos": []}
+            return 201, {"id": mid}, None
+        borrador = self.borradores.get(partes[3]) if len(partes) >= 5 and partes[2] == "messages" else None
+        if borrador is None:
+            return 404, {"error": {"code": "NotFound", "message": ruta}}, None
+        if partes[4:] == ["attachments"]:
+            borrador["adjuntos"].append((datos["name"], len(base64.b64decode(datos["contentBytes"]))))
+            return 201, {"id": f"a{len(borrador['adjuntos'])}"}, None
+        if partes[4:] == ["attachments", "createUploadSession"]:
+            item = datos["AttachmentItem"]
+            with self.lock:
+                sid = f"s{len(self.sesiones) + 1}"
+                self.sesiones[sid] = {"borrador": borrador, "nombre": item["name"], "tam": item["size"], "recibido": 0}
+            return 201, {"uploadUrl": f"{self.login_url}/upload/{sid}", "nextExpectedRanges": ["0-"]}, None
+        if partes[4:] == ["send"]:
+            self.borradores.pop(partes[3])
+            self._registrar(borrador["usuario"], borrador["mensaje"], borrador["adjuntos"], "borrador")
+            return 202, None, None
+        return 404, {"error": {"code": "NotFound", "message": ruta}}, None
+
+    def _put(self, ruta, rango, datos):
+        sesion = self.sesiones.get(ruta.strip("/").split("/")[-1])
+        m = re.match(r"bytes (\d+)-(\d+)/(\d+)$", rango)
+        if sesion is None or m is None:
+            return 404, {"error": {"code": "NotFound", "message": ruta}}, None
+        inicio, fin, total = (int(x) for x in m.groups())
+        if inicio != sesion["recibido"] or fin - inicio + 1 != len(datos) or total != sesion["tam"]:
+            return 416, {"error": {"code": "InvalidRange", "message": rango}}, None
+        if fin + 1 < total and len(datos) % (320 * 1024):
+            return 400, {"error": {"code": "InvalidChunk", "message": "el trozo debe ser múltiplo de 320 KiB"}}, None
+        sesion["recibido"] = fin + 1
+        if sesion["recibido"] < total:
+            return 200, {"nextExpectedRanges": [f"{sesion['recibido']}-"]}, None
+        sesion["borrador"]["adjuntos"].append((sesion["nombre"], total))
+        return 201, None, None
@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import reportes_aulas as ra
+
+
+def test_build_reports_genera_informes_y_archivos(df, coords, tmp_path):
+    options = ra.ReportOptions(out=str(tmp_path), make_global=True, pdf_engine="ninguno")
+    reports = ra.build_reports(df, options, coords)
+
+    docentes = reports.por_tipo("docente")
+    programas = reports.por_tipo("programa")
+    assert sorted(inf.clave for inf in docentes) == ["101", "102", "103", "104"]
+    assert sorted(inf.clave for inf in programas) == ["ADMI_SUR", "LENG_SUR", "PSIC_CENTRO"]
+    assert len(reports.por_tipo("global")) == 1
+
+    ana = next(inf for inf in docentes if inf.clave == "101")
+    assert ana.destinatarios == ["ana.perez@uniminuto.edu"]
+    assert "Cálculo II" in ana.html
+    juan = next(inf for inf in docentes if inf.clave == "104")
+    assert juan.destinatarios == []          # correo inválido: se genera pero no se envía
+
+    admi = next(inf for inf in programas if inf.clave == "ADMI_SUR")
+    assert admi.destinatarios == ["coord.admi@uniminuto.edu"]
+    assert all(Path(a).exists() for a in admi.adjuntos)
+    assert next(inf for inf in programas if inf.clave == "LENG_SUR").destinatarios == []
+
+    assert all(inf.tamano > 0 for inf in reports.informes)
+    assert (tmp_path / "global" / "global_programas__resumen.html").exists()
+    assert (tmp_path / "tamanos_mensajes.csv").read_text(encoding="utf-8").count("\n") == len(reports.informes) + 1
+
+
+def test_send_usa_el_transporte_y_omite_sin_destinatario(df, coords, tmp_path):
+    options = ra.ReportOptions(out=str(tmp_path), pdf_engine="ninguno")
+    reports = ra.build_reports(df, options, coords)
+    enviados = []
+
+    def transporte(to, asunto, html, attachments=None, **kw):
+        enviados.append(to)
+
+    assert ra.send(reports, transporte) == len(enviados) == 5     # 3 docentes + 2 programas con correo
+    assert "coord.psic@uniminuto.edu" in enviados
+    assert (tmp_path / "envios.csv").exists()
+
+
+def test_opciones_limitan_docentes_y_programas(df, coords, tmp_path):
+    options = ra.ReportOptions(out=str(tmp_path), pdf_engine="ninguno", only_programs={"PSIC_CENTRO"})
+    reports = ra.build_reports(df, options, coords)
+    assert [inf.clave for inf in reports.por_tipo("programa")] == ["PSIC_CENTRO"]
+    assert sorted(inf.clave for inf in reports.por_tipo("docente")) == ["102", "103"]
+
+
+@pytest.mark.skipif(not ra.reportlab_available(), reason="requiere ReportLab")
+def test_pdf_workers_envia_solo_texto_y_genera_los_mismos_pdf(df, coords, tmp_path):
+    momento = ra.MOMENTOS["2"]
+    gprog = df[df["PROGRAMA"] == "ADMI_SUR"]
+    carga = ra.carga_pdf_programa("reportlab", gprog, "DOCENTE", momento, html=None)
+    assert not any(isinstance(x, pd.DataFrame) for bloque in carga for x in bloque)
+    assert carga[0][0] == "ANA PÉREZ  (ID: 101)" and [f[0] for f in carga[0][1]] == ["65-1001", "65-1002"]
+
+    rutas = {}
+    for workers in (0, 1):
+        out = tmp_path / f"w{workers}"
+        options = ra.ReportOptions(out=str(out), pdf_engine="reportlab", pdf_workers=workers, send=("programas",))
+        reports = ra.build_reports(df, options, coords)
+        rutas[workers] = sorted(Path(a).name for inf in reports.informes for a in inf.adjuntos)
+        assert all(Path(a).read_bytes().startswith(b"%PDF") for inf in reports.informes for a in inf.adjuntos)
+    assert rutas[0] == rutas[1] and len(rutas[0]) == 3
+
+
+def test_por_coordinador_resume_y_adjunta_los_detalles(df, coords, tmp_path):
+    coords = {**coords, "PSIC_CENTRO": {**coords["PSIC_CENTRO"], "email": "coord.admi@uniminuto.edu"}}
+    options = ra.ReportOptions(out=str(tmp_path), pdf_engine="ninguno", send=("programas",), por_coordinador=True)
+    reports = ra.build_reports(df, options, coords)
+
+    [consolidado] = reports.por_tipo("coordinador")
+    assert [p.clave for p in consolidado.partes] == ["ADMI_SUR", "PSIC_CENTRO"]
+    assert consolidado.destinatarios == ["coord.admi@uniminuto.edu"]
+    assert "Aulas del programa" in consolidado.html and "LUIS GÓMEZ" in consolidado.html
+    assert "Cálculo II" not in consolidado.html                   # el detalle por NRC no va en el cuerpo
+    assert sorted(Path(a).name for a in consolidado.adjuntos) == [
+        f"{ra.FECHA_ETQ}_ADMI_SUR__detalle.html", f"{ra.FECHA_ETQ}_PSIC_CENTRO__detalle.html"]
+    assert [inf.clave for inf in reports.por_tipo("programa")] == ["LENG_SUR"]
@@ -0,0 +1,36 @@
+import reportes_aulas as ra
+
+
+def test_lru_expulsa_el_menos_usado():
+    cache = ra.ReportCache(maxsize=2)
+    renders = []
+
+    def render(valor):
+        return lambda: renders.append(valor) or valor
+
+    assert cache.get_or_render("a", render("A")) == "A"
+    assert cache.get_or_render("b", render("B")) == "B"
+    assert cache.get_or_render("a", render("otra")) == "A"     # acierto: "a" pasa a ser la más reciente
+    cache.get_or_render("c", render("C"))                      # expulsa "b"
+    assert list(cache._data) == ["a", "c"]
+    assert cache.get_or_render("b", render("B2")) == "B2"
+    assert renders == ["A", "B", "C", "B2"]
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_clear_vacia_la_cache():
+    cache = ra.ReportCache(maxsize=4)
+    cache.get_or_render("a", lambda: "A")
+    cache.clear()
+    assert cache.get_or_render("a", lambda: "A2") == "A2"
+
+
+def test_graficas_valen_solo_para_su_campana(df, tmp_path):
+    options = ra.ReportOptions(out=str(tmp_path / "png"), pdf_engine="ninguno", charts="png")
+    reports = ra.build_reports(df, options)
+    assert any(inf.inline for inf in reports.informes)
+    assert (ra.GRAFICAS.modo, ra.GRAFICAS._png, ra.GRAFICAS.hits) == ("html", {}, 0)
+
+    html = ra.build_reports(df, ra.ReportOptions(out=str(tmp_path / "html"), pdf_engine="ninguno"))
+    assert not any("cid:" in inf.html for inf in html.informes)
+    assert ra.GRAFICAS._png == {}
@@ -0,0 +1,34 @@
+import reportes_aulas as ra
+
+from .conftest import FILAS, crudo, frame
+
+
+def test_sin_duplicados_no_cambia_nada(df):
+    limpio, duplicados = ra.deduplicate(df)
+    assert len(limpio) == len(df)
+    assert duplicados.empty
+
+
+def test_conserva_la_mayor_final_y_el_orden_del_excel():
+    peor = ("65-1001", "Cálculo I", 101, "ANA PÉREZ", "ana.perez@uniminuto.edu", "ADMI_SUR", "", 20.0, 20.0, 40.0)
+    mejor = ("65-1003", "Contabilidad", 102, "LUIS GÓMEZ", "luis.gomez@uniminuto.edu", "ADMI_SUR", "", 45.0, 45.0, 90.0)
+    df = frame(FILAS[:3] + [peor, mejor] + FILAS[3:])
+
+    assert list(df["NRC"]) == ["65-1001", "65-1002", "65-1003", "65-2001", "65-2002", "65-3001"]
+    # 65-1001: se queda la primera (93 > 40); 65-1003: gana la repetida (90 > 71.5)
+    assert df.loc[df["NRC"] == "65-1001", "CALIFICACION FINAL"].item() == 93.0
+    assert df.loc[df["NRC"] == "65-1003", "CALIFICACION FINAL"].item() == 90.0
+
+
+def test_en_empate_gana_la_primera_y_reporta_diferencias():
+    exacta = FILAS[1]
+    otra_obs = FILAS[0][:6] + ("OTRA",) + FILAS[0][7:]       # misma final, distinta observación
+    df, duplicados = ra.deduplicate(ra.normalize_columns(crudo(FILAS + [exacta, otra_obs])))
+
+    assert len(df) == len(FILAS)
+    assert list(df["OBSERVACION"])[0] == "REV: SELECCIONADA"
+    assert list(duplicados.columns) == ra.DEDUP_COLS
+    # fila de Excel = índice + 2 (encabezado en la fila 1)
+    assert list(duplicados["fila"]) == [len(FILAS) + 2, len(FILAS) + 3]
+    assert list(duplicados["fila_conservada"]) == [3, 2]
+    assert list(duplicados["difiere"]) == ["", "OBSERVACION"]
@@ -0,0 +1,83 @@
+import reportes_aulas as ra
+
+from .conftest import FILAS, crudo, frame
+
+
+def test_sin_cambios(df):
+    assert ra.diff_frames(df, df.copy()).empty
+
+
+def test_nuevas_eliminadas_y_modificadas(df):
+    nueva = ("65-4001", "Estadística", 105, "SOFÍA VEGA", "sofia.vega@uniminuto.edu", "LENG_SUR", "", 40.0, 40.0, 80.0)
+    cambiada = FILAS[3][:7] + (30.0, 35.0, 65.0)
+    new = frame(FILAS[:3] + [cambiada, FILAS[4], nueva])      # 65-3001 desaparece
+
+    diff = ra.diff_frames(df, new)
+    assert list(diff.added["NRC"]) == ["65-4001"]
+    assert list(diff.removed["NRC"]) == ["65-3001"]
+    assert list(diff.changed["NRC"]) == ["65-2001"]
+    assert diff.changed["CAMBIOS"].item() == "CALIFICACION 2: 30.0 → 35.0; CALIFICACION FINAL: 60.0 → 65.0"
+    assert diff.docentes == {"103", "104", "105"}
+    assert diff.programas == {"PSIC_CENTRO", "LENG_SUR"}
+
+
+def test_cambio_de_programa_afecta_a_ambos(df):
+    movida = FILAS[2][:5] + ("PSIC_CENTRO",) + FILAS[2][6:]
+    diff = ra.diff_frames(df, frame(FILAS[:2] + [movida] + FILAS[3:]))
+    assert diff.changed["CAMBIOS"].item() == "Resp: ADMI_SUR → PSIC_CENTRO; PROGRAMA: ADMI_SUR → PSIC_CENTRO"
+    assert diff.programas == {"ADMI_SUR", "PSIC_CENTRO"}
+
+
+def test_destinatarios_afectados(df, coords):
+    cambiada = FILAS[0][:7] + (40.0, 40.0, 80.0)
+    diff = ra.diff_frames(df, frame([cambiada] + FILAS[1:]))
+    assert diff.recipients(df, coords) == ({"101": "ana.perez@uniminuto.edu"}, {"ADMI_SUR": "coord.admi@uniminuto.edu"})
+
+
+def test_guardar_y_recargar_no_es_un_cambio(df):
+    new = df.copy()
+    df.loc[0, "CALIFICACION FINAL"] = 63.169230769230765
+    new.loc[0, "CALIFICACION FINAL"] = 63.16923076923077       # lo que devuelve Excel al recargar
+    assert ra.diff_frames(df, new).empty
+
+    new.loc[0, "CALIFICACION FINAL"] = 63.17
+    assert ra.diff_frames(df, new).changed["CAMBIOS"].item() == "CALIFICACION FINAL: 63.169231 → 63.17"
+
+
+def test_watch_usa_las_opciones_de_build_reports(df, coords, tmp_path, monkeypatch):
+    cambiada = FILAS[3][:7] + (30.0, 35.0, 65.0)
+    new = frame(FILAS[:3] + [cambiada] + FILAS[4:])
+    estados = iter(["a", "b", "b"])
+    pausas = []
+
+    def sleep(_):
+        pausas.append(1)
+        if len(pausas) == 3:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(ra, "_file_state", lambda paths: next(estados))
+    monkeypatch.setattr(ra, "load_dataframe", lambda *a: new.copy())
+    monkeypatch.setattr(ra, "load_coords", lambda path: coords)
+    monkeypatch.setattr(ra.time, "sleep", sleep)
+    opciones = dict(pdf_engine="ninguno", minify="clases", charts="png")
+    watch = ra.ReportOptions(out=str(tmp_path / "watch"), **opciones)
+    ra.watch_loop("x.xlsx", None, df, watch, coords)
+
+    ra.build_reports(new, ra.ReportOptions(out=str(tmp_path / "full"), **opciones), coords)
+    regenerados = sorted(p.relative_to(tmp_path / "watch") for p in (tmp_path / "watch").rglob("*") if p.is_file())
+    assert any(p.parts[0] == "graficas" for p in regenerados)
+    assert ra.Path("destinatarios.csv") in regenerados
+    for rel in regenerados:
+        assert (tmp_path / "watch" / rel).read_bytes() == (tmp_path / "full" / rel).read_bytes(), rel
+
+
+def test_claves_repetidas_se_deduplican_antes_de_cruzar(df):
+    repetida = FILAS[0][:7] + (20.0, 20.0, 40.0)               # misma (ID DOCENTE, NRC), menor final
+    old = ra.normalize_columns(crudo(FILAS + [repetida]))
+    cambiada = FILAS[1][:7] + (41.0, 42.0, 83.0)
+    new = ra.normalize_columns(crudo([FILAS[0], cambiada] + FILAS[2:] + [repetida, repetida]))
+
+    diff = ra.diff_frames(old, new)
+    assert list(diff.changed["NRC"]) == ["65-1002"]
+    assert diff.added.empty and diff.removed.empty
+    assert diff.docentes == {"101"}
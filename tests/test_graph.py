@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+import reportes_aulas as ra
+
+from .graph_mock import GraphMock
+
+REMITENTE = "informes@uniminuto.edu"
+
+
+@pytest.fixture
+def esperas():
+    return []
+
+
+def _transporte(mock, esperas, concurrencia=4):
+    return ra.GraphTransport(REMITENTE, mock.TOKEN, mock.url, concurrencia=concurrencia, dormir=esperas.append)
+
+
+def _enviar(t, n, html="<p>hola</p>", adjuntos=None):
+    errores = []
+    for i in range(n):
+        t(f"docente{i}@uniminuto.edu", f"Informe {i}", html, attachments=adjuntos, al_terminar=errores.append)
+    t.flush()
+    return errores
+
+
+def test_lotes_de_a_20_solicitudes(esperas):
+    with GraphMock() as mock:
+        errores = _enviar(_transporte(mock, esperas), 45)
+    assert errores == [None] * 45
+    assert sorted(mock.lotes) == [5, 20, 20]
+    assert sorted(e["asunto"] for e in mock.enviados) == sorted(f"Informe {i}" for i in range(45))
+    assert {e["via"] for e in mock.enviados} == {"batch"}
+    assert {e["de"] for e in mock.enviados} == {REMITENTE}
+
+
+def test_lotes_limitados_a_4_mb_de_json(esperas):
+    html = "<p>" + "x" * (1536 * 1024) + "</p>"          # ~1,5 MB por mensaje: caben 2 por petición
+    with GraphMock() as mock:
+        errores = _enviar(_transporte(mock, esperas), 5, html)
+    assert errores == [None] * 5
+    assert sorted(mock.lotes) == [1, 2, 2]
+
+    grande = "<p>" + "x" * (ra.GRAPH_MAX_PETICION + 1) + "</p>"
+    with GraphMock() as mock:
+        assert _enviar(_transporte(mock, esperas), 1, grande) == [None]
+    assert mock.lotes == []
+    assert [e["via"] for e in mock.enviados] == ["borrador"]
+
+
+def test_429_se_reintenta_tras_retry_after(esperas):
+    with GraphMock(limitar=4, retry_after=2) as mock:
+        t = _transporte(mock, esperas)
+        errores = _enviar(t, 30)
+    assert errores == [None] * 30
+    assert mock.limitadas > 0
+    assert len(mock.enviados) == 30                          # cada mensaje una sola vez
+    assert esperas and set(esperas) == {2.0}
+    assert t.stats["reintentos"] == len(esperas)
+
+
+def test_429_tambien_en_peticiones_sueltas(esperas, tmp_path):
+    grande = tmp_path / "detalle.pdf"
+    grande.write_bytes(os.urandom(ra.GRAPH_ADJUNTO_DIRECTO + 1))
+    with GraphMock(limitar=2, retry_after=1) as mock:
+        errores = _enviar(_transporte(mock, esperas, concurrencia=1), 1, adjuntos=[str(grande)])
+    assert errores == [None]
+    assert mock.limitadas > 0 and set(esperas) == {1.0}
+    assert mock.enviados[0]["adjuntos"] == [("detalle.pdf", ra.GRAPH_ADJUNTO_DIRECTO + 1)]
+
+
+def test_adjunto_mayor_de_3_mb_por_sesion_de_carga(esperas, tmp_path):
+    grande = tmp_path / "detalle.pdf"
+    grande.write_bytes(os.urandom(7 * 1024 ** 2))
+    pequeno = tmp_path / "circular.pdf"
+    pequeno.write_bytes(b"%PDF" * 100)
+    with GraphMock() as mock:
+        t = _transporte(mock, esperas)
+        errores = _enviar(t, 1, adjuntos=[str(grande), str(pequeno)])
+    assert errores == [None]
+    [enviado] = mock.enviados
+    assert enviado["via"] == "borrador"
+    assert enviado["adjuntos"] == [("detalle.pdf", 7 * 1024 ** 2), ("circular.pdf", 400)]
+    assert t.stats["trozos"] == -(-7 * 1024 ** 2 // ra.GRAPH_TROZO)
+    assert not mock.borradores                               # el borrador se envió
+
+
+def test_error_de_graph_llega_al_llamador(esperas):
+    with GraphMock() as mock:
+        t = ra.GraphTransport(REMITENTE, "token-invalido", mock.url, dormir=esperas.append)
+        errores = _enviar(t, 2)
+    assert [str(e) for e in errores] == ["Graph HTTP 401: token"] * 2
+    assert mock.enviados == []
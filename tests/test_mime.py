@@ -0,0 +1,90 @@
+import base64
+import email.mime.application
+
+import pytest
+
+import reportes_aulas as ra
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 56, 57, 58, 1000, 123457])
+def test_b64_len_acota_la_codificacion_de_email(n):
+    cuerpo = email.mime.application.MIMEApplication(b"x" * n).get_payload().replace("\n", "\r\n")
+    # Estimación por arriba: a lo sumo un CRLF de más (cuando la última línea queda justa en 76)
+    assert 0 <= ra.b64_len(n) - len(cuerpo) <= 2
+
+
+def test_b64_len_valores_conocidos():
+    assert [ra.b64_len(n) for n in (0, 1, 3, 57, 58, 1000)] == [2, 6, 6, 80, 84, 1372]
+    assert ra.b64_len(10 ** 6) - len(base64.b64encode(b"x" * 10 ** 6)) == 2 * (1333336 // 76 + 1)
+
+
+def test_mime_size_suma_cuerpo_y_adjuntos(tmp_path):
+    sink = ra.DirectorySink(tmp_path)
+    pdf = sink.write_bytes("programas/a.pdf", b"%PDF" * 1000)
+    externo = tmp_path / "circular.pdf"
+    externo.write_bytes(b"z" * 500)
+    sink.close()
+
+    body = "<p>Informe – ñ</p>"
+    esperado = (ra.MIME_CABECERAS + ra.b64_len(len(body.encode("utf-8")))
+                + ra.MIME_PARTE + ra.b64_len(4000) + ra.MIME_PARTE + ra.b64_len(500))
+    assert ra.mime_size(body, [pdf, str(externo)], sink) == esperado
+
+
+def _detalle_grande(tmp_path):
+    sink = ra.DirectorySink(tmp_path)
+    texto = "".join(f"<tr><td>{i}</td><td>{i * 7919 % 104729}</td></tr>" for i in range(3000))
+    html_path = sink.write_text("programas/detalle.html", texto)
+    return sink, html_path, texto
+
+
+def test_pdf_antes_que_zip_si_hay_motor(tmp_path, monkeypatch):
+    sink, html_path, texto = _detalle_grande(tmp_path)
+    monkeypatch.setattr(ra, "pdf_engine", lambda nombre="auto": "reportlab")
+    options = ra.ReportOptions(max_mb=0.05)
+    motores = []
+
+    def render(engine):
+        motores.append(engine)
+        return b"%PDF-1.4 breve"
+
+    adjuntos = ra.zip_si_excede(sink, options, "<p>cuerpo</p>", [html_path, "circular.pdf"], html_path, texto,
+                                "programas/detalle.zip", ("programas/detalle.pdf", render))
+    sink.close()
+    assert motores == ["reportlab"]
+    assert [a.rsplit("/", 1)[-1] for a in adjuntos] == ["detalle.pdf", "circular.pdf"]
+
+
+def test_zip_como_ultimo_recurso(tmp_path, monkeypatch):
+    sink, html_path, texto = _detalle_grande(tmp_path)
+    monkeypatch.setattr(ra, "pdf_engine", lambda nombre="auto": None)
+    options = ra.ReportOptions(max_mb=0.05)
+    adjuntos = ra.zip_si_excede(sink, options, "<p>cuerpo</p>", [html_path], html_path, texto,
+                                "programas/detalle.zip", ("programas/detalle.pdf", lambda engine: b""))
+    sink.close()
+    assert adjuntos[0].endswith("detalle.zip")
+    assert ra.mime_size("<p>cuerpo</p>", adjuntos, sink) <= 0.05 * 1024 ** 2
+    # sin presupuesto (valor por defecto) no se toca nada
+    assert ra.zip_si_excede(sink, ra.ReportOptions(), "x", [html_path], html_path, texto, "z.zip") == [html_path]
+
+
+def test_sin_presupuesto_se_envian_los_mensajes_grandes(df, coords, tmp_path):
+    reports = ra.build_reports(df, ra.ReportOptions(out=str(tmp_path), pdf_engine="ninguno", send=("programas",)),
+                               coords)
+    for inf in reports.informes:
+        inf.tamano = 50 * 1024 ** 2
+    assert ra.send(reports, lambda *a, **kw: None) == 2
+
+    reports.options.max_mb = 10
+    assert ra.send(reports, lambda *a, **kw: None) == 0
+
+
+def test_tamano_de_adjunto_externo_sigue_al_archivo(tmp_path):
+    sink = ra.DirectorySink(tmp_path)
+    externo = tmp_path / "circular.pdf"
+    assert sink.size(str(externo)) == 0                      # todavía no existe
+    externo.write_bytes(b"a" * 100)
+    assert sink.size(str(externo)) == 100
+    externo.write_bytes(b"a" * 5000)
+    assert ra.mime_size("", [str(externo)], sink) == ra.MIME_CABECERAS + ra.b64_len(0) + ra.MIME_PARTE + ra.b64_len(5000)
+    sink.close()
@@ -0,0 +1,30 @@
+import reportes_aulas as ra
+import reportes_aulas_v1 as v1
+
+
+def _html(df, momento):
+    rows = df[df["ID DOCENTE"] == 101].to_dict("records")
+    return ra.html_docente("ANA PÉREZ", "101", rows, ra.MOMENTOS[momento])
+
+
+def test_momento_1_conserva_la_apariencia_del_script_v1(df):
+    html = _html(df, "1")
+    assert 'width="980" style="width:100%;max-width:980px' in html
+    assert "class='rev-chip rev-ok' style='" in html           # revisión con estilos en línea
+    assert ra.final_qual(95, ra.MOMENTOS["1"])[2] == "#16a34a"
+    assert ".badge-pill" in ra.wrap_for_pdf("", ra.MOMENTOS["1"])
+
+
+def test_momento_2_sin_cambios_de_apariencia(df):
+    html = _html(df, "2")
+    assert 'width="720" style="max-width:720px' in html
+    assert "class='rev-chip rev-ok'>" in html
+    assert ra.final_qual(95, ra.MOMENTOS["2"])[2] == "#14532d"
+    assert ra.wrap_for_pdf("x", ra.MOMENTOS["2"]) == ra.wrap_for_pdf("x")
+
+
+def test_v1_no_anade_momento_a_subcomandos_que_no_lo_aceptan():
+    assert v1.argv_v1(["merge", "a.json"]) == ["merge", "a.json"]
+    assert v1.argv_v1(["extract", "x.xlsx"]) == ["extract", "x.xlsx"]
+    assert v1.argv_v1(["serve"]) == ["serve", "--momento", "1"]
+    assert v1.argv_v1(["--momento=2"]) == ["--momento=2"]
@@ -0,0 +1,41 @@
+import pytest
+
+import reportes_aulas as ra
+
+from .conftest import crudo
+
+
+@pytest.fixture
+def excel(tmp_path):
+    path = tmp_path / "informes.xlsx"
+    crudo().to_excel(path, index=False)
+    return path
+
+
+def test_rutas_html_y_cache(excel):
+    server = ra.ReportServer(excel, motor_pdf="ninguno")
+    status, ctype, body = server.handle("/docente/101")
+    assert (status, ctype) == (200, "text/html; charset=utf-8")
+    assert "Cálculo II" in body.decode("utf-8")
+    server.handle("/docente/101")
+    assert server.cache.hits == 1
+    assert server.handle("/programa/ADMI_SUR/detalle")[0] == 200
+    assert server.handle("/docente/999")[0] == 404
+
+
+def test_pdf_sin_motor_devuelve_503(excel):
+    server = ra.ReportServer(excel, motor_pdf="ninguno")
+    assert server.handle("/global.pdf")[0] == 503
+    assert server.handle("/programa/ADMI_SUR/detalle.pdf")[0] == 503
+
+
+@pytest.mark.skipif(not ra.reportlab_available(), reason="requiere ReportLab")
+def test_pdf_con_reportlab_sin_wkhtmltopdf(excel, monkeypatch):
+    monkeypatch.setattr(ra, "pdf_available", lambda: False)
+    server = ra.ReportServer(excel)
+    assert server.motor_pdf == "reportlab"
+    for ruta in ("/global.pdf", "/programa/ADMI_SUR/detalle.pdf"):
+        status, ctype, body = server.handle(ruta)
+        assert (status, ctype) == (200, "application/pdf")
+        assert body.startswith(b"%PDF")
+    assert server.handle("/programa/NO_EXISTE/detalle.pdf")[0] == 404
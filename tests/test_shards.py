@@ -0,0 +1,37 @@
+import pandas as pd
+
+import reportes_aulas as ra
+
+
+def test_los_shards_cubren_el_frame_sin_solaparse(df):
+    n = 3
+    partes = [ra.shard_frames(df, i, n) for i in range(1, n + 1)]
+    docentes = pd.concat([d for d, _ in partes]).sort_index()
+    programas = pd.concat([p for _, p in partes]).sort_index()
+    pd.testing.assert_frame_equal(docentes, df)
+    pd.testing.assert_frame_equal(programas, df)
+
+
+def test_docente_va_al_shard_de_su_programa_principal(df):
+    n = 2
+    dueno = ra.shard_de("ADMI_SUR", n) + 1          # LUIS GÓMEZ: 1 aula en ADMI_SUR y 1 en PSIC_CENTRO → ADMI_SUR
+    docentes, _ = ra.shard_frames(df, dueno, n)
+    assert sorted(docentes.loc[docentes["ID DOCENTE"] == 102, "NRC"]) == ["65-1003", "65-2002"]
+
+
+def test_merge_de_parciales_igual_al_global_completo(df, tmp_path):
+    completo = tmp_path / "completo"
+    ra.build_reports(df, ra.ReportOptions(out=str(completo), make_global=True, pdf_engine="ninguno", send=()))
+
+    n = 2
+    parciales = []
+    for i in range(1, n + 1):
+        out = tmp_path / f"shard{i}"
+        ra.build_reports(df, ra.ReportOptions(out=str(out), make_global=True, pdf_engine="ninguno", shard=(i, n)))
+        parciales += [str(p) for p in (out / "global").glob("parcial_*.json")]
+    assert len(parciales) == n
+
+    unido = tmp_path / "unido"
+    ra.merge_main(parciales + ["--out", str(unido), "--pdf-engine", "ninguno"])
+    nombre = "global/global_programas__resumen.html"
+    assert (unido / nombre).read_text(encoding="utf-8") == (completo / nombre).read_text(encoding="utf-8")
@@ -0,0 +1,57 @@
+import os
+
+import reportes_aulas as ra
+
+
+def _sin_temporales(root):
+    return not [p for p in root.rglob("*") if p.name.endswith(".tmp")]
+
+
+def test_escritura_atomica_con_permisos_de_umask(tmp_path, monkeypatch):
+    umask = os.umask(0)
+    os.umask(umask)
+
+    def no_tocar(_):
+        raise AssertionError("os.umask cambia la máscara de todos los hilos")
+
+    monkeypatch.setattr(ra.os, "umask", no_tocar)
+    sink = ra.DirectorySink(tmp_path)
+    path = sink.write_bytes("programas/a.pdf", b"datos")
+    sink.close()
+    monkeypatch.undo()
+    assert open(path, "rb").read() == b"datos"
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+    assert _sin_temporales(tmp_path)
+    assert sink.size(path) == 5
+
+
+def test_contenido_identico_no_se_reescribe(tmp_path):
+    sink = ra.DirectorySink(tmp_path)
+    path = sink.write_text("docentes/a.html", "<p>hola</p>")
+    sink.flush()
+    os.utime(path, ns=(1, 1))
+    sink.write_text("docentes/a.html", "<p>hola</p>")
+    sink.write_text("docentes/b.html", "<p>hola</p>")
+    sink.close()
+    assert os.stat(path).st_mtime_ns == 1
+    assert (sink.escritos, sink.sin_cambios) == (2, 1)
+
+    sink = ra.DirectorySink(tmp_path)
+    sink.write_text("docentes/a.html", "<p>chao</p>")
+    sink.close()
+    assert os.stat(path).st_mtime_ns != 1
+    assert sink.escritos == 1
+
+
+def test_write_chunks_equivale_a_write_text(tmp_path):
+    sink = ra.DirectorySink(tmp_path)
+    texto = "<h1>Global</h1>\n" + "<tr><td>fila</td></tr>\n" * 100
+    a = sink.write_text("global/a.html", texto)
+    sink.flush()
+    b = sink.write_chunks("global/b.html", [texto[:7], texto[7:500], texto[500:]])
+    c = sink.write_chunks("global/a.html", [texto])                 # igual al que ya está: no se reescribe
+    sink.close()
+    assert open(a, "rb").read() == open(b, "rb").read()
+    assert c == a and sink.sin_cambios == 1
+    assert sink.size(b) == os.path.getsize(b)
+    assert _sin_temporales(tmp_path)
@@ -0,0 +1,38 @@
+import time
+from pathlib import Path
+
+import reportes_aulas as ra
+
+
+def test_stream_los_adjuntos_existen_al_enviar(df, coords, tmp_path, monkeypatch):
+    escribir = ra.DirectorySink._write_atomic
+
+    def lento(self, path, data):
+        time.sleep(0.05)
+        escribir(self, path, data)
+
+    monkeypatch.setattr(ra.DirectorySink, "_write_atomic", lento)
+    vistos = []
+
+    def transporte(to, asunto, html, attachments=None, **kw):
+        vistos.append((asunto, [Path(a).exists() for a in attachments]))
+
+    options = ra.ReportOptions(out=str(tmp_path), pdf_engine="ninguno", stream=True, make_global=True,
+                               send_global=True, global_to=["direccion@uniminuto.edu"])
+    reports = ra.stream_reports(df, options, coords, transport=transporte)
+
+    assert reports.informes == []
+    adjuntos = [existe for _, lista in vistos for existe in lista]
+    assert len(vistos) == 6 and len(adjuntos) == 3            # 3 docentes + 2 programas + global
+    assert all(adjuntos)
+    assert (tmp_path / "envios.csv").read_text(encoding="utf-8").count("\n") == 1 + 6
+
+
+def test_stream_genera_los_mismos_archivos_que_build_reports(df, coords, tmp_path):
+    archivos = {}
+    for modo in (False, True):
+        out = tmp_path / str(modo)
+        options = ra.ReportOptions(out=str(out), pdf_engine="ninguno", stream=modo)
+        (ra.stream_reports if modo else ra.build_reports)(df, options, coords)
+        archivos[modo] = {p.relative_to(out): p.read_bytes() for p in out.rglob("*.html")}
+    assert archivos[True] == archivos[False]